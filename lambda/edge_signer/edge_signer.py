@@ -11,33 +11,121 @@
 #   - Lambda execution role needs to have additional CloudWatch permissions for Lambda@Edge
 #   - Lambda execution role needs to have edgelambda.amazonaws.com as an additional principal
 
+# NOTE: never compare HMAC outputs with '=='; use hmac.compare_digest
+# This function only produces signatures, but any future verification of inbound signed
+#   URLs or cookies must call hmac.compare_digest(expected, provided) to avoid leaking timing
+
 import logging
 import hashlib
-import datetime
 import hmac
 import os
+import time
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Headers signed on every request, in canonical (sorted) order
+# All x-amz headers must be signed, including x-amz-cf-id which CloudFront adds itself
+_SIGNED_HEADER_NAMES = ('host', 'x-amz-cf-id', 'x-amz-content-sha256', 'x-amz-date', 'x-amz-security-token')
+_SIGNED_HEADERS_STR = ';'.join(_SIGNED_HEADER_NAMES)
+
+# Final credential scope term, pre-encoded for the signing key derivation
+_AWS4_REQUEST = b'aws4_request'
+
+# Lambda execution role credentials, re-read only when the access key id changes
+_creds = {'ak': None, 'sk': None, 'st': None}
+
+# Derived SigV4 signing keys, reused across warm invocations
+# The key only changes when the date, region, service or credentials change,
+#   so keep a small FIFO cache of recent keys rather than re-deriving per request
+# Entries are keyed on the access key id; the cache is also cleared when credentials rotate,
+#   see _get_credentials, so keys for old credentials are not kept around
+MAX_CACHE_SIZE = 8
+_SIGNING_KEY_CACHE: dict[tuple, hmac.HMAC] = {}
+
+# Last formatted request timestamps, keyed on the epoch second they were built for
+_last_sec = 0
+_last_amzdate = ''
+_last_datestamp = ''
+
+# Region parsed from each S3 Object Lambda origin domain name
+# The origin is fixed per distribution, so this holds very few entries
+_REGION_CACHE: dict[str, str] = {}
+
 # Copied from http://docs.aws.amazon.com/general/latest/gr/signature-v4-examples.html#signature-v4-examples-python
 
 
 def sign(key, msg):
-    return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
+    # One-shot HMAC, avoids building an hmac.HMAC object per call
+    # msg may be passed pre-encoded for constant values
+    return hmac.digest(key, msg if isinstance(msg, bytes) else msg.encode('utf-8'), 'sha256')
 
 
 def getSignatureKey(key, dateStamp, regionName, serviceName):
     kDate = sign(('AWS4' + key).encode('utf-8'), dateStamp)
     kRegion = sign(kDate, regionName)
     kService = sign(kRegion, serviceName)
-    kSigning = sign(kService, 'aws4_request')
+    kSigning = sign(kService, _AWS4_REQUEST)
     return kSigning
 
 
+def _get_signing_key_cached(accessKey, key, dateStamp, regionName, serviceName):
+    # Returns an HMAC already keyed with the derived signing key
+    # Copying the keyed HMAC skips re-running the key schedule for the final signature
+    # The access key id identifies the secret, so the raw credential is never kept as a cache key
+    cache_key = (accessKey, dateStamp, regionName, serviceName)
+    cached = _SIGNING_KEY_CACHE.get(cache_key)
+    if cached is None:
+        kSigning = getSignatureKey(key, dateStamp, regionName, serviceName)
+        cached = hmac.new(kSigning, None, hashlib.sha256)
+        # Evict the oldest entry (dicts keep insertion order)
+        if len(_SIGNING_KEY_CACHE) >= MAX_CACHE_SIZE:
+            del _SIGNING_KEY_CACHE[next(iter(_SIGNING_KEY_CACHE))]
+        _SIGNING_KEY_CACHE[cache_key] = cached
+    return cached
+
+
+def _get_credentials():
+    # Lambda rotates the role credentials in the environment; a new access key id means
+    #   all three values changed and any key derived from the old secret is no longer needed
+    access_key = os.environ.get('AWS_ACCESS_KEY_ID')
+    if access_key != _creds['ak']:
+        _creds['ak'] = access_key
+        _creds['sk'] = os.environ.get('AWS_SECRET_ACCESS_KEY')
+        _creds['st'] = os.environ.get('AWS_SESSION_TOKEN')
+        _SIGNING_KEY_CACHE.clear()
+    return _creds['ak'], _creds['sk'], _creds['st']
+
+
+def _get_region(domain_name):
+    # Origin domain: <ap>-<account>.s3-object-lambda.<region>.amazonaws.com
+    region = _REGION_CACHE.get(domain_name)
+    if region is None:
+        parts = domain_name.split('.')
+        region = parts[parts.index('amazonaws') - 1]
+        _REGION_CACHE[domain_name] = region
+    return region
+
+
+def _get_timestamps():
+    global _last_sec, _last_amzdate, _last_datestamp
+
+    sec = int(time.time())
+    if sec != _last_sec:
+        gm = time.gmtime(sec)
+        # Format date as YYYYMMDD'T'HHMMSS'Z'
+        _last_amzdate = time.strftime('%Y%m%dT%H%M%SZ', gm)
+        # Date w/o time, used in credential scope
+        _last_datestamp = time.strftime('%Y%m%d', gm)
+        _last_sec = sec
+    return _last_amzdate, _last_datestamp
+
+
 def lambda_handler(event, context):
-    logger.debug("Event JSON: {}".format(event))
-    logger.debug("Context JSON: {}".format(context))
+    # Only stringify the (large) event and context when debug logging is enabled
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Event JSON: %s", event)
+        logger.debug("Context JSON: %s", context)
 
     request = event['Records'][0]['cf']['request']
     headers = request['headers']
@@ -45,172 +133,118 @@ def lambda_handler(event, context):
 
     if not request['method'] == 'GET':
         logger.debug(
-            "Method {} doesn't qualify for S3 object Lambda. Returning original request.".format(
-                request['method']
-            )
+            "Method %s doesn't qualify for S3 object Lambda. Returning original request.",
+            request['method'],
         )
         return request
 
     # If the origin is not S3 Object Lambda, return the original request
-    try:
-        domain_name = request['origin']['custom']['domainName']
-        if not 's3-object-lambda' in domain_name:
-            raise Exception(
-                "S3 Object Lambda expected in origin domain name. Got {}".format(domain_name))
-    except Exception as e:
-        logger.error(e)
+    custom_origin = request.get('origin', {}).get('custom')
+    if not custom_origin:
+        logger.error("S3 Object Lambda expected as a custom origin. Got %s", request.get('origin'))
+        return request
+    domain_name = custom_origin.get('domainName', '')
+    if 's3-object-lambda' not in domain_name:
+        logger.error("S3 Object Lambda expected in origin domain name. Got %s", domain_name)
         return request
 
     # full_url = 'https://' + domain_name + request['uri']
 
     # Use Lambda execution role credentials
-    access_key = os.environ.get('AWS_ACCESS_KEY_ID')
-    secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
-    session_token = os.environ.get('AWS_SESSION_TOKEN')
+    access_key, secret_key, session_token = _get_credentials()
     service = 's3-object-lambda'
-    region = domain_name.split(
-        '.')[domain_name.split('.').index("amazonaws") - 1]
+    region = _get_region(domain_name)
     payload_hash = "UNSIGNED-PAYLOAD"
 
-    # Lowercase the header name (they appear to be already lowercased, but just in case)
-    # L@E header object {} example:
+    # CloudFront already lowercases header names in the L@E header object, e.g.:
     # "user-agent": [
     #   {
     #       "key": "User-Agent",
     #       "value": "Amazon CloudFront"
     #      }
     #   ],
-    lower_headers = {}
-    for header, value in headers.items():
-        if header.lower().startswith('x-amz') or header.lower() == 'host':
-            lower_headers[header.lower()] = value
-        else:
-            lower_headers[header] = value
-    request['headers'] = lower_headers
+    # Headers are updated in place; only guard against a capitalized Host, which is replaced below
+    if 'Host' in headers:
+        headers['host'] = headers.pop('Host')
 
     # Start building header/signature
-    t = datetime.datetime.utcnow()
-    # Format date as YYYYMMDD'T'HHMMSS'Z'
-    amzdate = t.strftime('%Y%m%dT%H%M%SZ')
-    datestamp = t.strftime('%Y%m%d')  # Date w/o time, used in credential scope
+    # Timestamps are only re-formatted when the second changes
+    amzdate, datestamp = _get_timestamps()
 
     # The steps below follow the example here:
     # https://docs.aws.amazon.com/general/latest/gr/sigv4-signed-request-examples.html#sig-v4-examples-get-auth-header
 
     # step 1 - define verb - this should be 'GET' and checked above
     method = request['method']
-    logger.debug("Step 1 (method): {}".format(method))
+    logger.debug("Step 1 (method): %s", method)
 
     # step 2: canonical URI from CF
     canonical_uri = request['uri']
-    logger.debug("Step 2 (canonical_uri): {}".format(canonical_uri))
+    logger.debug("Step 2 (canonical_uri): %s", canonical_uri)
 
     # Step 3: canonical query string from CF. This should be an empty string
     canonical_querystring = request['querystring']
-    logger.debug("Step 3 (canonical_querystring): {}".format(
-        canonical_querystring))
+    logger.debug("Step 3 (canonical_querystring): %s", canonical_querystring)
 
     # Step 4: Create the canonical headers and signed headers.
-    aws_headers = {}
-    aws_headers.update(
-        {
-            'host': [{'key': 'host', 'value': domain_name}],
-            'x-amz-date': [{'key': 'x-amz-date', 'value': amzdate}],
-            'x-amz-content-sha256': [{'key': 'x-amz-content-sha256', 'value': payload_hash}],
-            'x-amz-security-token': [{'key': 'x-amz-security-token', 'value': session_token}],
-        }
-    )
-    request['headers'].update(aws_headers)
-
-    # All x-amz headers must be signed - add blacklisted (CF auto-added) headers
-    # x-amz-cf-id is added by CloudFront automatically in the origin request
-    aws_headers.update(
-        {
-            'x-amz-cf-id': [{'key': 'x-amz-cf-id', 'value': cf_request_id}],
-        }
-    )
-
+    headers['host'] = [{'key': 'host', 'value': domain_name}]
+    headers['x-amz-date'] = [{'key': 'x-amz-date', 'value': amzdate}]
+    headers['x-amz-content-sha256'] = [{'key': 'x-amz-content-sha256', 'value': payload_hash}]
+    headers['x-amz-security-token'] = [{'key': 'x-amz-security-token', 'value': session_token}]
+
+    # All x-amz headers must be signed - x-amz-cf-id is added by CloudFront automatically
+    #   in the origin request (and is read-only for L@E), so it is signed below but not set on the request
+    # The signed header set is fixed, so build the canonical headers in their known sorted order
     canonical_headers = (
-        '\n'.join(["%s:%s" % (header, aws_headers[header][0]['value'])
-                  for header in sorted(aws_headers.keys())])
-        + '\n'
+        f"host:{domain_name}\n"
+        f"x-amz-cf-id:{cf_request_id}\n"
+        f"x-amz-content-sha256:{payload_hash}\n"
+        f"x-amz-date:{amzdate}\n"
+        f"x-amz-security-token:{session_token}\n"
     )
-    logger.debug("Step 4 (canonical_headers): {}".format(canonical_headers))
+    logger.debug("Step 4 (canonical_headers): %s", canonical_headers)
 
-    # Step 5: Create the list of signed headers.
-    signed_headers = ';'.join([h.lower() for h in sorted(aws_headers.keys())])
-    logger.debug("Step 5 (signed_headers): {}".format(signed_headers))
+    # Step 5: Create the list of signed headers. This is constant, see _SIGNED_HEADER_NAMES
+    signed_headers = _SIGNED_HEADERS_STR
+    logger.debug("Step 5 (signed_headers): %s", signed_headers)
 
     # Step 6: Create payload hash. For our S3 purpose this is 'UNSIGNED-PAYLOAD' defined above
-    logger.debug("Step 6 (payload_hash): {}".format(payload_hash))
+    logger.debug("Step 6 (payload_hash): %s", payload_hash)
 
     # Step 7: Combine elements to create canonical request
     canonical_request = (
-        method
-        + '\n'
-        + canonical_uri
-        + '\n'
-        + canonical_querystring
-        + '\n'
-        + canonical_headers
-        + '\n'
-        + signed_headers
-        + '\n'
-        + payload_hash
+        f"{method}\n{canonical_uri}\n{canonical_querystring}\n"
+        f"{canonical_headers}\n{signed_headers}\n{payload_hash}"
     )
-    logger.debug("Step 7 (canonical_request): {}".format(canonical_request))
+    logger.debug("Step 7 (canonical_request): %s", canonical_request)
 
     # Task 2: create the string to sign
     algorithm = 'AWS4-HMAC-SHA256'
-    credential_scope = datestamp + '/' + region + \
-        '/' + service + '/' + 'aws4_request'
-    string_to_sign = (
-        algorithm
-        + '\n'
-        + amzdate
-        + '\n'
-        + credential_scope
-        + '\n'
-        + hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
-    )
-    logger.debug("Task 2 (string_to_sign): {}".format(string_to_sign))
+    credential_scope = f"{datestamp}/{region}/{service}/aws4_request"
+    canonical_request_hash = hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+    string_to_sign = f"{algorithm}\n{amzdate}\n{credential_scope}\n{canonical_request_hash}"
+    logger.debug("Task 2 (string_to_sign): %s", string_to_sign)
 
     # Task 3: calculate the signature
-    signing_key = getSignatureKey(secret_key, datestamp, region, service)
+    base_mac = _get_signing_key_cached(access_key, secret_key, datestamp, region, service)
     string_to_sign_utf8 = string_to_sign.encode('utf-8')
-    signature = hmac.new(signing_key, string_to_sign_utf8,
-                         hashlib.sha256).hexdigest()
-    logger.debug("Task 3 (signature): {}".format(signature))
+    mac = base_mac.copy()
+    mac.update(string_to_sign_utf8)
+    signature = mac.hexdigest()
+    logger.debug("Task 3 (signature): %s", signature)
 
     # Task 4: add signing information to the request
     authorization_header = (
-        algorithm
-        + ' '
-        + 'Credential='
-        + access_key
-        + '/'
-        + credential_scope
-        + ', '
-        + 'SignedHeaders='
-        + signed_headers
-        + ', '
-        + 'Signature='
-        + signature
+        f"{algorithm} Credential={access_key}/{credential_scope}, "
+        f"SignedHeaders={signed_headers}, Signature={signature}"
     )
-    logger.debug("Task 4 (authorization_header): {}".format(
-        authorization_header))
-
-    auth_header = {}
-    auth_header['Authorization'] = [
-        {'key': 'Authorization', 'value': authorization_header}]
-
-    logger.debug("AWS headers: {}".format(auth_header))
+    logger.debug("Task 4 (authorization_header): %s", authorization_header)
 
     # Update headers
-    request['headers'].update(auth_header)
-    logger.debug("Request headers: {}".format(request['headers']))
+    headers['Authorization'] = [{'key': 'Authorization', 'value': authorization_header}]
+    logger.debug("Request headers: %s", headers)
 
-    logger.debug("Request: {}".format(request, indent=4))
+    logger.debug("Request: %s", request)
 
     # Return the signed request
     return request
@@ -29,6 +29,9 @@ class SsmReader(Construct):
                     f'arn:aws:ssm:{region}:{account_id}:parameter/{stack_name}*']
             ),
             log_retention=logs.RetentionDays.THREE_DAYS,
+            # The SDK bundled with the Lambda runtime supports SSM getParameter/deleteParameter
+            # Skipping the latest SDK install avoids an npm install on every deployment
+            install_latest_aws_sdk=False,
             on_update=self.__read_cf_output(region, parameter_name),
             on_delete=self.__delete_parameter(region, parameter_name)
         )